@@ -6,136 +6,219 @@
 """
 
 import ast
+import functools
 import math
-from typing import List
+import sys
+import types
+from collections import deque
+from typing import Deque, Tuple
+
+# 预先绑定 AST 节点类，避免热路径上反复访问 ast 模块属性
+_Constant = ast.Constant
+_UnaryOp = ast.UnaryOp
+_BinOp = ast.BinOp
+_Call = ast.Call
+_Name = ast.Name
+_Attr = ast.Attribute
+_Add = ast.Add
+_Sub = ast.Sub
+_Mult = ast.Mult
+_Div = ast.Div
+_Mod = ast.Mod
+_Pow = ast.Pow
+_UAdd = ast.UAdd
+_USub = ast.USub
+
+# 交互命令（小写）
+_COMMANDS = frozenset({'quit', 'exit', 'history', 'clear'})
+
+# 白名单函数与常量（只读，勿修改）
+_ALLOWED_FUNCS = {
+    'sqrt': math.sqrt,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'log': math.log,
+    'log10': math.log10,
+}
+_ALLOWED_NAMES = {
+    'pi': math.pi,
+    'e': math.e,
+}
+
+# 错误提示
+_ERR_ZERO_DIV = "❌ 错误：除零错误"
+_ERR_SYNTAX = "❌ 错误：语法错误，请检查输入"
+_ERR_DOMAIN = "❌ 错误：数学域错误（如负数开平方）"
+
+# 允许的运算符类型（按 type(node.op) 直接查表）
+_BINOPS = frozenset({_Add, _Sub, _Mult, _Div, _Mod, _Pow})
+_UNOPS = frozenset({_UAdd, _USub})
+
+# 欢迎信息（固定内容，一次性写出）
+_WELCOME = "\n".join([
+    "=" * 60,
+    "🔢 欢迎使用 Python 计算器 🔢",
+    "=" * 60,
+    "📋 支持的运算：",
+    "   • 基本运算：+, -, *, /, %, ** (幂运算)",
+    "   • 高级运算：sqrt() (开方), sin(), cos(), tan()",
+    "   • 对数函数：log() (自然对数), log10() (常用对数)",
+    "   • 括号：() 支持优先级计算",
+    "\n💡 使用示例：",
+    "   2 + 3 * 4",
+    "   sqrt(16) + sin(pi/2)",
+    "   log(100) / log(10)",
+    "\n📝 其他命令：",
+    "   history - 查看计算历史",
+    "   clear   - 清除历史记录",
+    "   quit/exit - 退出程序",
+    "=" * 60,
+]) + "\n"
+
+
+@functools.lru_cache(maxsize=512)
+def _parse(expression: str) -> ast.AST:
+    """解析表达式（按字符串缓存，所有求值器实例共享）"""
+    return ast.parse(expression, mode='eval').body
 
 
 class SafeExpressionEvaluator:
     """
     安全的表达式求值器，使用 AST 解析防止安全漏洞
     只允许白名单内的操作：数字、运算符、函数调用
+    校验通过的 AST 编译为字节码，由解释器直接执行
     """
 
+    # 固定属性，访问时走槽位而不是实例字典
+    __slots__ = ('math_module', 'allowed_functions', 'allowed_names',
+                 '_dispatch', '_env', '_eval_cached')
+
     def __init__(self):
         self.math_module = math
-        self.allowed_functions = {
-            'sqrt': math.sqrt,
-            'sin': math.sin,
-            'cos': math.cos,
-            'tan': math.tan,
-            'log': math.log,
-            'log10': math.log10,
+        self.allowed_functions = _ALLOWED_FUNCS
+        self.allowed_names = _ALLOWED_NAMES
+        # 节点类型 -> 校验函数，避免逐个 isinstance 判断
+        self._dispatch = {
+            _Constant: self._v_const,
+            _UnaryOp: self._v_unary,
+            _BinOp: self._v_binop,
+            _Call: self._v_call,
+            _Name: self._v_name,
         }
-        self.allowed_names = {
-            'pi': math.pi,
-            'e': math.e,
+        # 求值环境：仅含白名单函数与常量，禁用内置函数
+        self._env = {
+            '__builtins__': {},
+            'math': types.SimpleNamespace(**_ALLOWED_FUNCS),
+            **_ALLOWED_FUNCS,
+            **_ALLOWED_NAMES,
         }
+        # 按表达式字符串缓存求值结果：表达式不含变量，结果只取决于字符串本身，
+        # 重复输入时跳过解析、校验、编译与执行
+        self._eval_cached = functools.lru_cache(maxsize=256)(self._eval_source)
 
     def eval(self, expression: str) -> float:
         """
         安全地计算表达式
         只允许白名单内的操作
         """
-        try:
-            # 预处理：将 ^ 转换为 **
+        # 预处理：将 ^ 转换为 **（不含 ^ 时不复制字符串）
+        if '^' in expression:
             expression = expression.replace('^', '**')
-            # 解析 AST
-            tree = ast.parse(expression, mode='eval')
-            return self._eval_node(tree.body)
+        # 唯一的异常边界：把底层异常统一转换为带提示的 ValueError
+        try:
+            return self._eval_cached(expression)
         except ZeroDivisionError:
-            raise ValueError("❌ 错误：除零错误")
+            raise ValueError(_ERR_ZERO_DIV)
         except (SyntaxError, TypeError):
-            raise ValueError("❌ 错误：语法错误，请检查输入")
+            raise ValueError(_ERR_SYNTAX)
         except ValueError as e:
-            if "math domain error" in str(e).lower():
-                raise ValueError("❌ 错误：数学域错误（如负数开平方）")
+            if str(e) == "math domain error":
+                raise ValueError(_ERR_DOMAIN)
             raise
         except Exception as e:
             raise ValueError(f"❌ 错误：{str(e)}")
 
-    def _eval_node(self, node: ast.AST) -> float:
-        """递归求值 AST 节点"""
-        # 数字（整数或浮点数）
-        if isinstance(node, ast.Constant):
-            if isinstance(node.value, (int, float)):
-                return float(node.value)
-            else:
-                raise ValueError(f"不支持的常量类型：{type(node.value).__name__}")
-
-        # 一元运算（如：-5）
-        elif isinstance(node, ast.UnaryOp):
-            operand = self._eval_node(node.operand)
-            if isinstance(node.op, ast.UAdd):
-                return +operand
-            elif isinstance(node.op, ast.USub):
-                return -operand
-            else:
-                raise ValueError(f"不支持的一元运算符：{type(node.op).__name__}")
-
-        # 二元运算（如：2 + 3）
-        elif isinstance(node, ast.BinOp):
-            left = self._eval_node(node.left)
-            right = self._eval_node(node.right)
-
-            if isinstance(node.op, ast.Add):
-                return left + right
-            elif isinstance(node.op, ast.Sub):
-                return left - right
-            elif isinstance(node.op, ast.Mult):
-                return left * right
-            elif isinstance(node.op, ast.Div):
-                return left / right
-            elif isinstance(node.op, ast.Mod):
-                return left % right
-            elif isinstance(node.op, ast.Pow):
-                return left ** right
-            else:
-                raise ValueError(f"不支持的二元运算符：{type(node.op).__name__}")
-
-        # 函数调用（如：sqrt(16)）
-        elif isinstance(node, ast.Call):
-            # 获取函数名
-            if isinstance(node.func, ast.Name):
-                func_name = node.func.id
-            elif isinstance(node.func, ast.Attribute):
-                # 处理 math.sqrt 这种形式
-                if isinstance(node.func.value, ast.Name) and node.func.value.id == 'math':
-                    # 如果用户输入了 math.sqrt，直接提取函数名
-                    func_name = node.func.attr
-                    if func_name not in self.allowed_functions:
-                        raise ValueError(f"不支持的函数：{func_name}")
-                else:
-                    raise ValueError(f"不支持的属性访问：{node.func.attr}")
+    def _eval_source(self, expression: str) -> float:
+        """编译并执行表达式（由 _eval_cached 缓存，异常不会被缓存）"""
+        return eval(self._compile_source(expression), self._env)
+
+    def _compile_source(self, expression: str) -> types.CodeType:
+        """解析、校验并编译表达式"""
+        body = _parse(expression)
+        self._validate(body)
+        return compile(ast.Expression(body), '<expr>', 'eval')
+
+    def _validate(self, root: ast.AST) -> None:
+        """按白名单校验 AST：显式栈迭代遍历，按节点类型查表分派"""
+        dispatch = self._dispatch
+        todo = [root]
+        pop = todo.pop
+        push = todo.extend
+        while todo:
+            node = pop()
+            try:
+                handler = dispatch[type(node)]
+            except KeyError:
+                raise ValueError(f"不支持的 AST 节点类型：{type(node).__name__}")
+            # 处理函数返回待校验的子节点
+            push(handler(node))
+
+    def _v_const(self, node: ast.Constant) -> Tuple[ast.AST, ...]:
+        """数字（整数或浮点数）"""
+        if not isinstance(node.value, (int, float)):
+            raise ValueError(f"不支持的常量类型：{type(node.value).__name__}")
+        # 统一按浮点数运算（与原求值器一致，也避免超大整数幂运算）
+        node.value = float(node.value)
+        return ()
+
+    def _v_unary(self, node: ast.UnaryOp) -> Tuple[ast.AST, ...]:
+        """一元运算（如：-5）"""
+        if type(node.op) not in _UNOPS:
+            raise ValueError(f"不支持的一元运算符：{type(node.op).__name__}")
+        return (node.operand,)
+
+    def _v_binop(self, node: ast.BinOp) -> Tuple[ast.AST, ...]:
+        """二元运算（如：2 + 3）"""
+        if type(node.op) not in _BINOPS:
+            raise ValueError(f"不支持的二元运算符：{type(node.op).__name__}")
+        # 先压右再压左，保证左操作数先被校验
+        return (node.right, node.left)
+
+    def _v_call(self, node: ast.Call) -> Tuple[ast.AST, ...]:
+        """函数调用（如：sqrt(16)）"""
+        # 获取函数名
+        if isinstance(node.func, _Name):
+            func_name = node.func.id
+        elif isinstance(node.func, _Attr):
+            # 处理 math.sqrt 这种形式（求值环境中的 math 只含白名单函数）
+            if isinstance(node.func.value, _Name) and node.func.value.id == 'math':
+                func_name = node.func.attr
             else:
-                raise ValueError("不支持的函数调用格式")
-
-            # 检查函数是否允许
-            if func_name not in self.allowed_functions:
-                raise ValueError(f"不支持的函数：{func_name}")
-
-            # 检查参数数量
-            if len(node.args) != 1:
-                raise ValueError(f"函数 {func_name} 需要1个参数")
+                raise ValueError(f"不支持的属性访问：{node.func.attr}")
+        else:
+            raise ValueError("不支持的函数调用格式")
 
-            # 检查是否使用了关键字参数
-            if node.keywords:
-                raise ValueError(f"不支持关键字参数")
+        # 检查函数是否允许
+        if func_name not in _ALLOWED_FUNCS:
+            raise ValueError(f"不支持的函数：{func_name}")
 
-            # 计算参数
-            arg = self._eval_node(node.args[0])
+        # 检查参数数量
+        if len(node.args) != 1:
+            raise ValueError(f"函数 {func_name} 需要1个参数")
 
-            # 调用函数
-            return self.allowed_functions[func_name](arg)
+        # 检查是否使用了关键字参数
+        if node.keywords:
+            raise ValueError(f"不支持关键字参数")
 
-        # 名称（如：pi, e）
-        elif isinstance(node, ast.Name):
-            if node.id in self.allowed_names:
-                return float(self.allowed_names[node.id])
-            else:
-                raise ValueError(f"未定义的名称：{node.id}")
+        # 校验参数
+        return (node.args[0],)
 
-        else:
-            raise ValueError(f"不支持的 AST 节点类型：{type(node).__name__}")
+    def _v_name(self, node: ast.Name) -> Tuple[ast.AST, ...]:
+        """名称（如：pi, e）"""
+        if node.id not in _ALLOWED_NAMES:
+            raise ValueError(f"未定义的名称：{node.id}")
+        return ()
 
 
 class Calculator:
@@ -143,48 +226,34 @@ class Calculator:
 
     def __init__(self):
         """初始化计算器"""
-        self.history: List[str] = []  # 存储计算历史
+        self.history: Deque[str] = deque(maxlen=1000)  # 存储计算历史（最多保留1000条）
+        self._recent: Deque[str] = deque(maxlen=10)  # 最近10条，供菜单显示
         self.welcome_shown = False  # 标记是否已显示欢迎信息
+        self._turns_since_menu = 0  # 距上次显示菜单的成功计算次数
         self.evaluator = SafeExpressionEvaluator()  # 安全表达式求值器
 
     def show_welcome(self):
         """显示欢迎信息和操作指南"""
         if not self.welcome_shown:
-            print("=" * 60)
-            print("🔢 欢迎使用 Python 计算器 🔢")
-            print("=" * 60)
-            print("📋 支持的运算：")
-            print("   • 基本运算：+, -, *, /, %, ** (幂运算)")
-            print("   • 高级运算：sqrt() (开方), sin(), cos(), tan()")
-            print("   • 对数函数：log() (自然对数), log10() (常用对数)")
-            print("   • 括号：() 支持优先级计算")
-            print("\n💡 使用示例：")
-            print("   2 + 3 * 4")
-            print("   sqrt(16) + sin(pi/2)")
-            print("   log(100) / log(10)")
-            print("\n📝 其他命令：")
-            print("   history - 查看计算历史")
-            print("   clear   - 清除历史记录")
-            print("   quit/exit - 退出程序")
-            print("=" * 60)
+            sys.stdout.write(_WELCOME)
             self.welcome_shown = True
 
     def show_menu(self):
         """显示菜单"""
-        print("\n" + "=" * 40)
-        print("📊 计算历史记录：")
-        if self.history:
-            for i, record in enumerate(self.history[-10:], 1):  # 显示最近10条
-                print(f"   {i}. {record}")
+        lines = ["\n" + "=" * 40, "📊 计算历史记录："]
+        if self._recent:
+            # 显示最近10条
+            lines.extend(f"   {i}. {record}" for i, record in enumerate(self._recent, 1))
         else:
-            print("   (暂无历史记录)")
-        print("=" * 40)
+            lines.append("   (暂无历史记录)")
+        lines.append("=" * 40)
+        sys.stdout.write("\n".join(lines) + "\n")
 
     def get_user_input(self) -> str:
         """获取用户输入"""
         try:
-            expression = input("\n🔸 请输入计算表达式 (输入 'quit' 退出): ").strip()
-            return expression.lower()
+            # 保留原始大小写，命令判断时再转小写（如区分 PI 与 pi）
+            return input("\n🔸 请输入计算表达式 (输入 'quit' 退出): ").strip()
         except KeyboardInterrupt:
             return "quit"
 
@@ -195,69 +264,34 @@ class Calculator:
             print("❌ 错误：输入不能为空")
             return False
 
-        # 检查是否是命令
-        if expression.lower() in ['quit', 'exit', 'history', 'clear']:
-            return True
-
+        # 注意：命令已在 run 中处理，这里只会收到待计算的表达式
         # 注意：不再需要字符白名单检查
         # AST 解析器会处理所有的安全检查和错误提示
 
         return True
 
-    def calculate_basic(self, expression: str) -> float:
-        """执行基本运算计算"""
-        try:
-            # 使用 AST 安全求值器（^ 转换在 eval 内部处理）
-            result = self.evaluator.eval(expression)
-            return result
-
-        except ValueError:
-            raise
-        except Exception as e:
-            raise ValueError(f"❌ 错误：{str(e)}")
-
-    def calculate_advanced(self, expression: str) -> float:
-        """执行高级运算计算"""
-        try:
-            # 使用 AST 安全求值器（^ 转换在 eval 内部处理）
-            result = self.evaluator.eval(expression)
-            return result
-
-        except ValueError:
-            raise
-        except Exception as e:
-            raise ValueError(f"❌ 错误：{str(e)}")
-
     def calculate(self, expression: str) -> float:
-        """主计算函数，自动选择基本或高级运算"""
-        # 检查是否包含高级函数
-        advanced_functions = ['sqrt', 'sin', 'cos', 'tan', 'log', 'log10']
-        if any(func in expression.lower() for func in advanced_functions):
-            return self.calculate_advanced(expression)
-        else:
-            return self.calculate_basic(expression)
+        """主计算函数（^ 转换和函数调用均由 AST 求值器统一处理）"""
+        return self.evaluator.eval(expression)
 
     def format_result(self, result: float) -> str:
         """格式化结果输出"""
-        # 如果是整数，转换为整数显示
-        if result.is_integer():
-            return str(int(result))
-        # 如果是接近整数的浮点数
-        elif abs(result - round(result)) < 1e-10:
-            return str(int(round(result)))
-        # 否则保留适当的小数位数
-        else:
-            # 根据数值大小决定小数位数
-            if abs(result) >= 1e6 or abs(result) <= 1e-4:
-                return f"{result:.6e}"  # 科学计数法
-            else:
-                return f"{result:.8g}"  # 最多8位有效数字
+        # 整数或接近整数的浮点数，转换为整数显示
+        rounded = round(result)
+        if abs(result - rounded) < 1e-10:
+            return str(rounded)
+        # 否则根据数值大小决定小数位数
+        magnitude = abs(result)
+        if magnitude >= 1e6 or magnitude <= 1e-4:
+            return f"{result:.6e}"  # 科学计数法
+        return f"{result:.8g}"  # 最多8位有效数字
 
     def add_to_history(self, expression: str, result: float):
         """添加计算记录到历史"""
         result_str = self.format_result(result)
         record = f"{expression} = {result_str}"
         self.history.append(record)
+        self._recent.append(record)
 
     def show_history(self):
         """显示完整历史记录"""
@@ -265,16 +299,15 @@ class Calculator:
             print("\n📝 暂无历史记录")
             return
 
-        print("\n" + "=" * 60)
-        print("📊 完整计算历史记录")
-        print("=" * 60)
-        for i, record in enumerate(self.history, 1):
-            print(f"{i:3d}. {record}")
-        print("=" * 60)
+        lines = ["\n" + "=" * 60, "📊 完整计算历史记录", "=" * 60]
+        lines.extend(f"{i:3d}. {record}" for i, record in enumerate(self.history, 1))
+        lines.append("=" * 60)
+        sys.stdout.write("\n".join(lines) + "\n")
 
     def clear_history(self):
         """清除历史记录"""
         self.history.clear()
+        self._recent.clear()
         print("\n✅ 历史记录已清除")
 
     def run(self):
@@ -283,27 +316,22 @@ class Calculator:
 
         while True:
             try:
-                # 显示菜单（每3次计算显示一次）
-                if len(self.history) % 3 == 0:
-                    self.show_menu()
-
                 # 获取用户输入
                 expression = self.get_user_input()
 
-                # 处理退出命令
-                if expression in ['quit', 'exit']:
+                # 处理命令（不区分大小写）
+                cmd = expression.lower()
+                if cmd in _COMMANDS:
+                    if cmd == 'history':
+                        self.show_history()
+                        continue
+                    if cmd == 'clear':
+                        self.clear_history()
+                        continue
+                    # quit / exit
                     print("\n👋 感谢使用计算器，再见！")
                     break
 
-                # 处理特殊命令
-                if expression == 'history':
-                    self.show_history()
-                    continue
-
-                if expression == 'clear':
-                    self.clear_history()
-                    continue
-
                 # 验证输入
                 if not self.validate_expression(expression):
                     continue
@@ -319,6 +347,12 @@ class Calculator:
                 # 添加到历史
                 self.add_to_history(expression, result)
 
+                # 显示菜单（每3次成功计算显示一次）
+                self._turns_since_menu += 1
+                if self._turns_since_menu >= 3:
+                    self.show_menu()
+                    self._turns_since_menu = 0
+
             except KeyboardInterrupt:
                 print("\n\n👋 程序被用户中断，再见！")
                 break